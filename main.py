@@ -1,12 +1,86 @@
 import Metashape
-from PySide2 import QtWidgets, QtCore, QtGui
+from PySide2 import QtWidgets, QtCore
 import os
-from pathlib import Path
+import codecs
+import csv
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.tif', '.tiff', '.png')
+
+
+def _normalize_path(path):
+    return os.path.normcase(os.path.realpath(path))
+
+
+def iter_images(folder, exclude_dir=None):
+    """Пути к поддерживаемым изображениям в папке и её подпапках"""
+    # Вложенная папка результатов пропускается, чтобы не импортировать прошлые результаты
+    exclude_dir = _normalize_path(exclude_dir) if exclude_dir else None
+
+    for root, dirs, files in os.walk(folder):
+        if exclude_dir:
+            dirs[:] = [name for name in dirs
+                       if _normalize_path(os.path.join(root, name)) != exclude_dir]
+        for name in files:
+            if name.lower().endswith(SUPPORTED_FORMATS):
+                yield os.path.join(root, name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_crs(epsg):
+    """Система координат по коду EPSG (создаётся один раз)"""
+    return Metashape.CoordinateSystem(epsg)
+
+
+@functools.lru_cache(maxsize=None)
+def get_ortho_projection(epsg):
+    """Плоская проекция ортофотоплана в заданной системе координат (создаётся один раз)"""
+    projection = Metashape.OrthoProjection()
+    projection.type = Metashape.OrthoProjection.Type.Planar
+    projection.crs = get_crs(epsg)
+    return projection
+
+
+def project_stem(project_name):
+    """Имя проекта без расширения .psx (по умолчанию "project")"""
+    if not project_name:
+        project_name = "project"
+
+    if project_name.lower().endswith('.psx'):
+        project_name = project_name[:-4]
+
+    return project_name
+
+
+@functools.lru_cache(maxsize=32)
+def build_project_path(base_path, project_name):
+    """Полный путь к файлу проекта .psx"""
+    if not base_path:
+        return None
+
+    return os.path.join(base_path, project_stem(project_name) + '.psx')
 
 
 class TelemetrySettingsDialog(QtWidgets.QDialog):
     """Диалог настроек импорта телеметрии"""
 
+    _DELIM_MAP = {
+        ", (запятая)": ",",
+        "; (точка с запятой)": ";",
+        "\t (табуляция)": "\t",
+        "Пробел": " "
+    }
+
+    _CRS_MAP = {
+        "EPSG::4326 (WGS 84)": "EPSG::4326",
+        "EPSG::3857 (Web Mercator)": "EPSG::3857",
+        "EPSG::32637 (WGS 84 / UTM zone 37N)": "EPSG::32637",
+        "Другая...": "EPSG::4326"
+    }
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Настройки импорта телеметрии")
@@ -19,12 +93,7 @@ class TelemetrySettingsDialog(QtWidgets.QDialog):
         crs_group = QtWidgets.QGroupBox("Система координат")
         crs_layout = QtWidgets.QVBoxLayout()
         self.crs_combo = QtWidgets.QComboBox()
-        self.crs_combo.addItems([
-            "EPSG::4326 (WGS 84)",
-            "EPSG::3857 (Web Mercator)",
-            "EPSG::32637 (WGS 84 / UTM zone 37N)",
-            "Другая..."
-        ])
+        self.crs_combo.addItems(list(self._CRS_MAP))
         crs_layout.addWidget(self.crs_combo)
         crs_group.setLayout(crs_layout)
         layout.addWidget(crs_group)
@@ -32,7 +101,7 @@ class TelemetrySettingsDialog(QtWidgets.QDialog):
         delimiter_group = QtWidgets.QGroupBox("Разделитель")
         delimiter_layout = QtWidgets.QHBoxLayout()
         self.delimiter_combo = QtWidgets.QComboBox()
-        self.delimiter_combo.addItems([", (запятая)", "; (точка с запятой)", "\t (табуляция)", "Пробел"])
+        self.delimiter_combo.addItems(list(self._DELIM_MAP))
         delimiter_layout.addWidget(self.delimiter_combo)
         delimiter_group.setLayout(delimiter_layout)
         layout.addWidget(delimiter_group)
@@ -55,27 +124,10 @@ class TelemetrySettingsDialog(QtWidgets.QDialog):
 
     def get_settings(self):
         """Получение настроек импорта"""
-        # Получаем разделитель
-        delimiter_map = {
-            ", (запятая)": ",",
-            "; (точка с запятой)": ";",
-            "\t (табуляция)": "\t",
-            "Пробел": " "
-        }
-        delimiter = delimiter_map[self.delimiter_combo.currentText()]
-
-        crs_map = {
-            "EPSG::4326 (WGS 84)": "EPSG::4326",
-            "EPSG::3857 (Web Mercator)": "EPSG::3857",
-            "EPSG::32637 (WGS 84 / UTM zone 37N)": "EPSG::32637",
-            "Другая...": "EPSG::4326"
-        }
-        crs = crs_map[self.crs_combo.currentText()]
-
         return {
-            'delimiter': delimiter,
+            'delimiter': self._DELIM_MAP[self.delimiter_combo.currentText()],
             'columns': self.columns_edit.text(),
-            'crs': crs
+            'crs': self._CRS_MAP[self.crs_combo.currentText()]
         }
 
 
@@ -86,21 +138,57 @@ class MetashapeProcessor(QtCore.QThread):
     status_updated = QtCore.Signal(str)
     finished_successfully = QtCore.Signal(bool, str)
 
+    _ACCURACY_MAP = {
+        'HighestAccuracy': 0,
+        'HighAccuracy': 1,
+        'MediumAccuracy': 2,
+        'LowAccuracy': 3
+    }
+
+    _QUALITY_MAP = {
+        'UltraHighQuality': 1,
+        'HighQuality': 2,
+        'MediumQuality': 4,
+        'LowQuality': 8,
+        'LowestQuality': 16
+    }
+
+    _OUTPUT_EXTENSIONS = {
+        'GeoTIFF': '.tif',
+        'GeoPackage': '.gpkg'
+    }
+
     def __init__(self, images_folder, telemetry_file, output_path, settings, path,name):
         super().__init__()
         self.images_folder = images_folder
         self.telemetry_file = telemetry_file
         self.output_path = output_path
         self.settings = settings
+        self._downscale_match = self._ACCURACY_MAP.get(settings.get('accuracy', 'HighAccuracy'), 1)
+        self._downscale_depth = self._QUALITY_MAP.get(settings.get('dense_cloud_quality', 'MediumQuality'), 4)
         self.doc = Metashape.app.document
         self.project_path = path
         self.project_name = name
+        self.output_format = settings.get('output_format', 'GeoTIFF')
+        # Имя результата совпадает с именем файла проекта
+        self.output_file = os.path.join(output_path,
+                                        project_stem(name) + self._OUTPUT_EXTENSIONS[self.output_format])
+        self.gpu_mask = 0
+        self.telemetry_loaded = False
+        self._last_emit = 0.0
+
+        self.ortho_projection = get_ortho_projection(settings.get('output_crs', 'EPSG::3857'))
 
     def run(self):
         """Основная функция обработки"""
+        # Настройки видеокарт глобальны для Metashape, после обработки они возвращаются
+        previous_gpu_mask = Metashape.app.gpu_mask
+        previous_cpu_enable = Metashape.app.cpu_enable
         try:
 
-            doc = Metashape.app.document
+            self.configure_gpu()
+
+            doc = self.doc
             doc.save(self.project_path)
             chunk = doc.chunk
 
@@ -116,7 +204,6 @@ class MetashapeProcessor(QtCore.QThread):
                 self.status_updated.emit("Загрузка телеметрии...")
                 self.load_telemetry(chunk)
                 self.progress_updated.emit(20)
-            doc.save(self.project_path)
 
             self.status_updated.emit("Поиск особых точек...")
             self.match_photos(chunk)
@@ -131,8 +218,6 @@ class MetashapeProcessor(QtCore.QThread):
             self.build_dense_cloud(chunk)
             self.progress_updated.emit(60)
 
-            doc.save()
-
             self.status_updated.emit("Построение ЦММ...")
             self.build_Dem(chunk)
             self.progress_updated.emit(70)
@@ -157,25 +242,20 @@ class MetashapeProcessor(QtCore.QThread):
             self.status_updated.emit(error_msg)
             self.finished_successfully.emit(False, error_msg)
 
+        finally:
+            Metashape.app.gpu_mask = previous_gpu_mask
+            Metashape.app.cpu_enable = previous_cpu_enable
 
-    def load_images(self, chunk):
-        """Загрузка изображений в chunk"""
-        image_list = []
-        supported_formats = ['.jpg', '.jpeg', '.tif', '.tiff', '.png']
-
-        for ext in supported_formats:
-            image_list.extend(Path(self.images_folder).glob(f"*{ext}"))
-            image_list.extend(Path(self.images_folder).glob(f"*{ext.upper()}"))
 
-        photo_list = []
-        for image in image_list:
-            if str(image) not in photo_list:
-                photo_list.append(str(image))
+    def load_images(self, chunk):
+        """Загрузка изображений в chunk (включая вложенные папки)"""
+        # Сортировка даёт стабильный порядок снимков между запусками
+        photo_list = sorted(iter_images(self.images_folder, self.output_path))
 
         if not photo_list:
             raise Exception(f"Изображения не найдены в папке: {self.images_folder}")
 
-        chunk.addPhotos(photo_list)
+        chunk.addPhotos(photo_list, progress=self._stage_progress(5, 15))
 
     def load_telemetry(self, chunk):
         """Загрузка телеметрии"""
@@ -186,83 +266,205 @@ class MetashapeProcessor(QtCore.QThread):
                 'crs': 'EPSG::4326'
             })
 
+            columns = telemetry_settings['columns']
+            crs = get_crs(telemetry_settings['crs'])
+
+            # Простой формат из n/x/y/z разбираем сами, остальное отдаём импортеру Metashape
+            if sorted(columns) == ['n', 'x', 'y', 'z']:
+                applied = self.apply_telemetry(chunk, columns, telemetry_settings['delimiter'], crs)
+                if applied:
+                    self.telemetry_loaded = True
+                    return
+                print("Предупреждение: Ни одна камера не сопоставлена с телеметрией, "
+                      "используется импорт Metashape")
+
             chunk.importReference(self.telemetry_file,
                                   format=Metashape.ReferenceFormatCSV,
-                                  columns=telemetry_settings['columns'],
+                                  columns=columns,
                                   delimiter=telemetry_settings['delimiter'],
-                                  crs=Metashape.CoordinateSystem(telemetry_settings['crs']))
-            s=chunk.cameras
-            for i in s:
-                i.reference.enabled = True
+                                  crs=crs,
+                                  progress=self._stage_progress(15, 20))
+            for camera in chunk.cameras:
+                reference = camera.reference
+                reference.enabled = True
+                if reference.location is not None:
+                    self.telemetry_loaded = True
         except Exception as e:
             print(f"Предупреждение: Не удалось загрузить телеметрию: {e}")
 
-    def match_photos(self, chunk):
-        accuracy = self.get_accuracy()
+    def apply_telemetry(self, chunk, columns, delimiter, crs):
+        """Запись координат из телеметрии в камеры, возвращает число сопоставленных камер"""
+        locations = self.read_telemetry(columns, delimiter)
+        # Имя в файле может отличаться от метки камеры расширением или его отсутствием
+        stems = {os.path.splitext(name)[0]: location for name, location in locations.items()}
+
+        matched = []
+        for camera in chunk.cameras:
+            label = camera.label
+            location = locations.get(label) or stems.get(os.path.splitext(label)[0])
+            if location is not None:
+                matched.append((camera, location))
+
+        if not matched:
+            return 0
+
+        if chunk.crs is None or chunk.crs.wkt != crs.wkt:
+            chunk.crs = crs
+        for camera, location in matched:
+            reference = camera.reference
+            reference.location = location
+            reference.enabled = True
+        return len(matched)
+
+    def read_telemetry(self, columns, delimiter):
+        """Чтение координат камер из файла телеметрии за один проход"""
+        name_col, x_col, y_col, z_col = (columns.index(c) for c in 'nxyz')
+        # Десятичная запятая допустима, если запятая не является разделителем
+        decimal_comma = delimiter != ','
+
+        with open(self.telemetry_file, 'rb') as f:
+            quoted = b'"' in f.read(65536)
+
+        locations = {}
+        if quoted:
+            for encoding in ('utf-8-sig', 'cp1251'):
+                try:
+                    with open(self.telemetry_file, newline='', encoding=encoding) as f:
+                        rows = csv.reader(f, delimiter=delimiter, skipinitialspace=delimiter == ' ')
+                        for row in rows:
+                            try:
+                                coords = [row[x_col], row[y_col], row[z_col]]
+                                if decimal_comma:
+                                    coords = [value.replace(',', '.') for value in coords]
+                                locations[row[name_col].strip()] = tuple(map(float, coords))
+                            except (IndexError, ValueError):
+                                # Заголовок, комментарий или пустая строка
+                                continue
+                    return locations
+                except UnicodeDecodeError:
+                    locations.clear()
+            return locations
+
+        # Без кавычек достаточно разбить байтовые строки по разделителю
+        delimiter_bytes = None if delimiter == ' ' else delimiter.encode()
+        with open(self.telemetry_file, 'rb') as f:
+            for line_number, line in enumerate(f):
+                if line_number == 0 and line.startswith(codecs.BOM_UTF8):
+                    line = line[len(codecs.BOM_UTF8):]
+                parts = line.split(delimiter_bytes)
+                try:
+                    coords = [parts[x_col], parts[y_col], parts[z_col]]
+                    if decimal_comma:
+                        coords = [value.replace(b',', b'.') for value in coords]
+                    location = tuple(map(float, coords))
+                    name = parts[name_col].strip()
+                except (IndexError, ValueError):
+                    continue
+                try:
+                    locations[name.decode('utf-8')] = location
+                except UnicodeDecodeError:
+                    locations[name.decode('cp1251')] = location
+        return locations
 
-        chunk.matchPhotos(downscale=self.get_downscale(accuracy),
-                          generic_preselection=self.settings.get('generic_preselection', True),
-                          reference_preselection=self.settings.get('reference_preselection', True))
+    def match_photos(self, chunk):
+        generic_preselection = self.settings.get('generic_preselection', True)
+        reference_preselection = self.settings.get('reference_preselection', True)
+        # С координатами камер пары подбираются по ним, общая выборка не нужна
+        if reference_preselection and self.telemetry_loaded and any(
+                camera.reference.enabled and camera.reference.location is not None
+                for camera in chunk.cameras):
+            generic_preselection = False
+
+        chunk.matchPhotos(downscale=self._downscale_match,
+                          generic_preselection=generic_preselection,
+                          reference_preselection=reference_preselection,
+                          reference_preselection_mode=Metashape.ReferencePreselectionSource,
+                          keypoint_limit=self.settings.get('keypoint_limit', 40000),
+                          tiepoint_limit=self.settings.get('tiepoint_limit', 10000),
+                          progress=self._stage_progress(20, 30))
 
     def align_photos(self, chunk):
-        chunk.alignCameras(adaptive_fitting=self.settings.get('adaptive_fitting', True))
+        chunk.alignCameras(adaptive_fitting=self.settings.get('adaptive_fitting', True),
+                           progress=self._stage_progress(30, 45))
 
-    def build_dense_cloud(self, chunk):
-        quality = self.get_quality()
+    def configure_gpu(self):
+        """Включение выбранных (по умолчанию всех) видеокарт"""
+        all_devices = (1 << len(Metashape.app.enumGPUDevices())) - 1
+        self.gpu_mask = (self.settings.get('gpu_mask', 0) & all_devices) or all_devices
+        if self.gpu_mask:
+            Metashape.app.gpu_mask = self.gpu_mask
+            Metashape.app.cpu_enable = False
 
-        chunk.buildDepthMaps(downscale=self.get_downscale(quality),
-                                 filter_mode=Metashape.FilterMode.AggressiveFiltering)
-        chunk.buildPointCloud()
+    def build_dense_cloud(self, chunk):
+        depth_params = dict(downscale=self._downscale_depth,
+                            filter_mode=Metashape.FilterMode.AggressiveFiltering,
+                            max_neighbors=self.settings.get('max_neighbors', 16),
+                            subdivide_task=True,
+                            reuse_depth=self.settings.get('reuse_depth', True),
+                            progress=self._stage_progress(45, 55))
+        try:
+            chunk.buildDepthMaps(**depth_params)
+        except Exception:
+            if not self.gpu_mask & (self.gpu_mask - 1):
+                raise
+            # Повтор на одной видеокарте, если многокарточный режим не сработал
+            Metashape.app.gpu_mask = self.gpu_mask & -self.gpu_mask
+            chunk.buildDepthMaps(**depth_params)
+        chunk.buildPointCloud(progress=self._stage_progress(55, 60))
 
     def build_Dem(self, chunk):
-        chunk.buildDem(source_data=Metashape.PointCloudData, interpolation=Metashape.EnabledInterpolation)
+        chunk.buildDem(source_data=Metashape.PointCloudData, interpolation=Metashape.EnabledInterpolation,
+                       progress=self._stage_progress(60, 70))
 
 
     def build_Ortofotoplan(self, chunk):
-        chunk.buildOrthomosaic(surface_data=Metashape.PointCloudData)
+        chunk.buildOrthomosaic(surface_data=Metashape.PointCloudData, projection=self.ortho_projection,
+                               refine_seamlines=self.settings.get('refine_seamlines', False),
+                               progress=self._stage_progress(70, 85))
 
 
     def export_orthophoto(self, chunk):
 
-        out_projection = Metashape.OrthoProjection()
-        out_projection.type = Metashape.OrthoProjection.Type.Planar
-        out_projection.crs = Metashape.CoordinateSystem("EPSG::3857")
-        name = self.project_name
+        output_file = self.output_file
+
+        export_params = dict(path=output_file,
+                             source_data=Metashape.OrthomosaicData,
+                             raster_transform=Metashape.RasterTransformNone,
+                             save_alpha=False,projection=self.ortho_projection,
+                             progress=self._stage_progress(85, 100))
+
+        if self.output_format == 'GeoPackage':
+            export_params['format'] = Metashape.RasterFormatGeoPackage
+        else:
+            compression = Metashape.ImageCompression()
+            compression.tiff_compression = Metashape.ImageCompression.TiffCompressionLZW
+            compression.tiff_big = True
+            compression.tiff_tiled = True
+            compression.tiff_overviews = True
+
+            export_params.update(format=Metashape.RasterFormatTiles,
+                                 image_format=Metashape.ImageFormatTIFF,
+                                 image_compression=compression)
 
-        output_file = os.path.join(self.output_path, name+".gpkg")
+        # 0 - исходное разрешение ортофотоплана
+        resolution = self.settings.get('resolution', 0)
+        if resolution:
+            export_params['resolution'] = resolution
 
-        chunk.exportRaster(path=output_file,
-                           source_data=Metashape.OrthomosaicData,
-                           format=Metashape.RasterFormatGeoPackage,
-                           raster_transform=Metashape.RasterTransformNone,
-                           save_alpha=False,projection=out_projection)
+        chunk.exportRaster(**export_params)
 
         return output_file
 
-    def get_accuracy(self):
-        """Получение точности"""
-        accuracy_map = {
-            'HighestAccuracy': 0,
-            'HighAccuracy': 1,
-            'MediumAccuracy': 2,
-            'LowAccuracy': 3
-        }
-        return accuracy_map.get(self.settings.get('accuracy', 'HighAccuracy'), 1)
-
-    def get_quality(self):
-        """Получение качества"""
-        quality_map = {
-            'UltraHighQuality':1,
-            'HighQuality': 2,
-            'MediumQuality': 4,
-            'LowQuality':8,
-            "LowestQuality":16
-        }
-        return quality_map.get(self.settings.get('dense_cloud_quality', 'MediumQuality'), 4)
+    def _emit_progress(self, value):
+        """Отправка прогресса в интерфейс не чаще раза в 100 мс"""
+        now = time.monotonic()
+        if value >= 100 or now - self._last_emit > 0.1:
+            self._last_emit = now
+            self.progress_updated.emit(value)
 
-    def get_downscale(self, level):
-        """Получение коэффициента масштабирования"""
-        return level
+    def _stage_progress(self, start, end):
+        """Колбэк прогресса Metashape, отображающий 0-100% этапа в диапазон start-end"""
+        return lambda percent: self._emit_progress(int(start + (end - start) * percent / 100))
 
 
 class OrthophotoSettingsDialog(QtWidgets.QDialog):
@@ -292,6 +494,42 @@ class OrthophotoSettingsDialog(QtWidgets.QDialog):
         self.quality_combo.setCurrentText("MediumQuality")
         main_layout.addRow("Качество плотного облака:", self.quality_combo)
 
+        self.max_neighbors_spin = QtWidgets.QSpinBox()
+        self.max_neighbors_spin.setRange(2, 64)
+        self.max_neighbors_spin.setValue(16)
+        self.max_neighbors_spin.setToolTip("Число соседних снимков для карты глубины.\n"
+                                           "Для надирной съёмки с большим перекрытием достаточно 6-8")
+        main_layout.addRow("Соседей для карт глубины:", self.max_neighbors_spin)
+
+        self.keypoint_limit_spin = QtWidgets.QSpinBox()
+        self.keypoint_limit_spin.setRange(0, 1000000)
+        self.keypoint_limit_spin.setSingleStep(1000)
+        self.keypoint_limit_spin.setValue(40000)
+        main_layout.addRow("Лимит ключевых точек:", self.keypoint_limit_spin)
+
+        self.tiepoint_limit_spin = QtWidgets.QSpinBox()
+        self.tiepoint_limit_spin.setRange(0, 1000000)
+        self.tiepoint_limit_spin.setSingleStep(1000)
+        self.tiepoint_limit_spin.setValue(10000)
+        main_layout.addRow("Лимит связующих точек:", self.tiepoint_limit_spin)
+
+        self.output_crs_combo = QtWidgets.QComboBox()
+        self.output_crs_combo.addItems(["EPSG::3857", "EPSG::4326", "EPSG::32637"])
+        main_layout.addRow("Система координат результата:", self.output_crs_combo)
+
+        self.output_format_combo = QtWidgets.QComboBox()
+        self.output_format_combo.addItems(["GeoTIFF", "GeoPackage"])
+        main_layout.addRow("Формат результата:", self.output_format_combo)
+
+        self.resolution_spin = QtWidgets.QDoubleSpinBox()
+        self.resolution_spin.setSpecialValueText("Исходное")
+        self.resolution_spin.setToolTip("Размер пикселя в единицах системы координат результата")
+        main_layout.addRow("Разрешение экспорта:", self.resolution_spin)
+
+        self._resolution_in_degrees = None
+        self.update_resolution_units(self.output_crs_combo.currentText())
+        self.output_crs_combo.currentTextChanged.connect(self.update_resolution_units)
+
 
         layout.addWidget(main_group)
 
@@ -310,6 +548,21 @@ class OrthophotoSettingsDialog(QtWidgets.QDialog):
         self.adaptive_fitting_cb.setChecked(True)
         advanced_layout.addRow("Адаптивная подгонка:", self.adaptive_fitting_cb)
 
+        self.reuse_depth_cb = QtWidgets.QCheckBox()
+        self.reuse_depth_cb.setChecked(True)
+        advanced_layout.addRow("Повторно использовать карты глубины:", self.reuse_depth_cb)
+
+        self.refine_seamlines_cb = QtWidgets.QCheckBox()
+        self.refine_seamlines_cb.setChecked(False)
+        self.refine_seamlines_cb.setToolTip("Заметно увеличивает время построения ортофотоплана")
+        advanced_layout.addRow("Уточнять линии сшивки:", self.refine_seamlines_cb)
+
+        self.gpu_mask_spin = QtWidgets.QSpinBox()
+        self.gpu_mask_spin.setRange(0, 255)
+        self.gpu_mask_spin.setSpecialValueText("Все")
+        self.gpu_mask_spin.setToolTip("Битовая маска видеокарт: 1 - первая, 2 - вторая, 3 - обе...")
+        advanced_layout.addRow("Маска видеокарт:", self.gpu_mask_spin)
+
 
         layout.addWidget(advanced_group)
 
@@ -319,25 +572,62 @@ class OrthophotoSettingsDialog(QtWidgets.QDialog):
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
 
+    def update_resolution_units(self, epsg):
+        """Настройка поля разрешения под единицы системы координат результата"""
+        in_degrees = get_crs(epsg).wkt.startswith('GEOGCS')
+        if in_degrees == self._resolution_in_degrees:
+            return
+        self._resolution_in_degrees = in_degrees
+
+        # Размер пикселя съёмки с БПЛА в градусах порядка 1e-7
+        if in_degrees:
+            self.resolution_spin.setDecimals(10)
+            self.resolution_spin.setRange(0, 1)
+            self.resolution_spin.setSingleStep(0.0000001)
+            self.resolution_spin.setSuffix(" °")
+        else:
+            self.resolution_spin.setDecimals(4)
+            self.resolution_spin.setRange(0, 1000)
+            self.resolution_spin.setSingleStep(0.01)
+            self.resolution_spin.setSuffix(" м")
+        # Значение в других единицах не имеет смысла
+        self.resolution_spin.setValue(0)
+
     def get_settings(self):
         """Получение настроек"""
         return {
             'accuracy': self.accuracy_combo.currentText(),
             'dense_cloud_quality': self.quality_combo.currentText(),
+            'max_neighbors': self.max_neighbors_spin.value(),
+            'keypoint_limit': self.keypoint_limit_spin.value(),
+            'tiepoint_limit': self.tiepoint_limit_spin.value(),
+            'output_crs': self.output_crs_combo.currentText(),
+            'output_format': self.output_format_combo.currentText(),
+            'resolution': self.resolution_spin.value(),
             'generic_preselection': self.generic_preselection_cb.isChecked(),
             'reference_preselection': self.reference_preselection_cb.isChecked(),
             'adaptive_fitting': self.adaptive_fitting_cb.isChecked(),
+            'reuse_depth': self.reuse_depth_cb.isChecked(),
+            'refine_seamlines': self.refine_seamlines_cb.isChecked(),
+            'gpu_mask': self.gpu_mask_spin.value(),
         }
 
 
 class OrthophotoWidget(QtWidgets.QWidget):
     """Компактный виджет для панели инструментов"""
 
+    folders_checked = QtCore.Signal(str, str, str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.processor_thread = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
         self.settings = self.get_default_settings()
+        self._last_status = None
+        self._settings_dialog = None
+        self._telemetry_dialog = None
         self.init_ui()
+        self.folders_checked.connect(self.on_folders_checked)
 
     def init_ui(self):
         layout = QtWidgets.QVBoxLayout(self)
@@ -406,39 +696,36 @@ class OrthophotoWidget(QtWidgets.QWidget):
         self.start_btn.clicked.connect(self.start_processing)
         layout.addWidget(self.start_btn)
 
-        self.progress_bar = QtWidgets.QProgressBar()
-        self.progress_bar.setVisible(False)
-        layout.addWidget(self.progress_bar)
+        # Прогресс бар создаётся при первом запуске обработки
+        self.progress_bar = None
 
         self.status_label = QtWidgets.QLabel("Готов")
         self.status_label.setStyleSheet("color: #27ae60;")
         layout.addWidget(self.status_label)
+        self._status_metrics = self.status_label.fontMetrics()
 
     def get_project_path(self):
         """Возвращает полный путь к проекту"""
-        base_path = self.output_folder_edit.text().strip()
-        project_name = self.project_name_edit.text().strip()
-
-        if not base_path:
-            return None
-        if not project_name:
-            project_name = "project"
-
-        if project_name.lower().endswith('.psx'):
-            project_name = project_name[:-4]
-
-        project_name += '.psx'
-
-        return os.path.join(base_path, project_name)
+        return build_project_path(self.output_folder_edit.text().strip(),
+                                  self.project_name_edit.text().strip())
 
     def get_default_settings(self):
         """Настройки по умолчанию"""
         return {
             'accuracy': 'HighAccuracy',
             'dense_cloud_quality': 'MediumQuality',
+            'max_neighbors': 16,
+            'keypoint_limit': 40000,
+            'tiepoint_limit': 10000,
+            'output_crs': 'EPSG::3857',
+            'output_format': 'GeoTIFF',
+            'resolution': 0,
             'generic_preselection': True,
             'reference_preselection': True,
             'adaptive_fitting': True,
+            'reuse_depth': True,
+            'refine_seamlines': False,
+            'gpu_mask': 0,
             'telemetry_settings': {
                 'delimiter': '\t',
                 'columns': 'nxyz',
@@ -471,52 +758,61 @@ class OrthophotoWidget(QtWidgets.QWidget):
 
     def open_settings(self):
         """Открытие диалога настроек"""
-        dialog = OrthophotoSettingsDialog(self)
-
+        if self._settings_dialog is None:
+            self._settings_dialog = OrthophotoSettingsDialog(self)
+        dialog = self._settings_dialog
 
         dialog.accuracy_combo.setCurrentText(self.settings['accuracy'])
         dialog.quality_combo.setCurrentText(self.settings['dense_cloud_quality'])
+        dialog.max_neighbors_spin.setValue(self.settings['max_neighbors'])
+        dialog.keypoint_limit_spin.setValue(self.settings['keypoint_limit'])
+        dialog.tiepoint_limit_spin.setValue(self.settings['tiepoint_limit'])
+        dialog.output_crs_combo.setCurrentText(self.settings['output_crs'])
+        dialog.output_format_combo.setCurrentText(self.settings['output_format'])
+        dialog.resolution_spin.setValue(self.settings['resolution'])
         dialog.generic_preselection_cb.setChecked(self.settings['generic_preselection'])
         dialog.reference_preselection_cb.setChecked(self.settings['reference_preselection'])
         dialog.adaptive_fitting_cb.setChecked(self.settings['adaptive_fitting'])
+        dialog.reuse_depth_cb.setChecked(self.settings['reuse_depth'])
+        dialog.refine_seamlines_cb.setChecked(self.settings['refine_seamlines'])
+        dialog.gpu_mask_spin.setValue(self.settings['gpu_mask'])
 
         if dialog.exec_() == QtWidgets.QDialog.Accepted:
             self.settings = dialog.get_settings()
 
     def validate_inputs(self):
-        """Валидация входных данных"""
+        """Валидация заполнения полей"""
         if not self.images_folder_edit.text().strip():
             QtWidgets.QMessageBox.warning(self, "Ошибка", "Выберите папку со снимками!")
             return False
 
-        if not os.path.exists(self.images_folder_edit.text()):
-            QtWidgets.QMessageBox.warning(self, "Ошибка", "Папка со снимками не существует!")
-            return False
-
         if not self.output_folder_edit.text().strip():
             QtWidgets.QMessageBox.warning(self, "Ошибка", "Выберите папку для сохранения!")
             return False
 
-        if not os.path.exists(self.output_folder_edit.text()):
-            try:
-                os.makedirs(self.output_folder_edit.text())
-            except:
-                QtWidgets.QMessageBox.warning(self, "Ошибка", "Не удалось создать папку для сохранения!")
-                return False
-
-        images_folder = self.images_folder_edit.text()
-        supported_formats = ['.jpg', '.jpeg', '.tif', '.tiff', '.png']
-        image_count = 0
-
-        for ext in supported_formats:
-            image_count += len(list(Path(images_folder).glob(f"*{ext}")))
-            image_count += len(list(Path(images_folder).glob(f"*{ext.upper()}")))
+        return True
 
-            if image_count == 0:
-                QtWidgets.QMessageBox.warning(self, "Ошибка", "В выбранной папке нет поддерживаемых изображений!")
-                return False
+    def check_folders(self, images_folder, output_folder):
+        """Проверка папок на диске (выполняется в фоновом потоке)"""
+        try:
+            if not os.path.isdir(images_folder):
+                error = "Папка со снимками не существует!"
+            elif _normalize_path(images_folder) == _normalize_path(output_folder):
+                # Результаты прошлых запусков (.tif) иначе попадут в набор снимков
+                error = "Папка для сохранения не должна совпадать с папкой со снимками!"
+            elif next(iter_images(images_folder, output_folder), None) is None:
+                error = "В выбранной папке нет поддерживаемых изображений!"
+            else:
+                try:
+                    os.makedirs(output_folder, exist_ok=True)
+                    error = ""
+                except (OSError, ValueError):
+                    error = "Не удалось создать папку для сохранения!"
+        except Exception as e:
+            error = f"Ошибка проверки папок: {str(e)}"
 
-        return True
+        # Сигнал отправляется всегда, иначе кнопка запуска останется заблокированной
+        self.folders_checked.emit(error, images_folder, output_folder)
 
     def start_processing(self):
         """Запуск обработки"""
@@ -524,11 +820,27 @@ class OrthophotoWidget(QtWidgets.QWidget):
             print("not Valid Inputs!")
             return
 
+        # Обращения к диску (в т.ч. сетевому) не блокируют интерфейс
+        self.start_btn.setEnabled(False)
+        self._executor.submit(self.check_folders,
+                              self.images_folder_edit.text().strip(),
+                              self.output_folder_edit.text().strip())
+
+    def on_folders_checked(self, error, images_folder, output_folder):
+        """Продолжение запуска после проверки папок"""
+        if error:
+            QtWidgets.QMessageBox.warning(self, "Ошибка", error)
+            self.start_btn.setEnabled(True)
+            return
+
         telemetry_file = self.telemetry_file_edit.text() if self.telemetry_file_edit.text() else None
 
         if telemetry_file:
-            dialog = TelemetrySettingsDialog(self)
+            if self._telemetry_dialog is None:
+                self._telemetry_dialog = TelemetrySettingsDialog(self)
+            dialog = self._telemetry_dialog
             if dialog.exec_() != QtWidgets.QDialog.Accepted:
+                self.start_btn.setEnabled(True)
                 return
 
             self.settings['telemetry_settings'] = dialog.get_settings()
@@ -541,19 +853,23 @@ class OrthophotoWidget(QtWidgets.QWidget):
         self.output_folder_edit.setEnabled(False)
         self.output_btn.setEnabled(False)
         self.settings_btn.setEnabled(False)
+        self.ensure_progress_bar()
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
         self.status_label.setText("Обработка...")
+        self._last_status = None
         self.status_label.setStyleSheet("color: #f39c12;")
         self.project_name_edit.setEnabled(False)
 
+        # Используются именно проверенные пути, а не текущее содержимое полей
+        project_name = self.project_name_edit.text().strip()
         self.processor_thread = MetashapeProcessor(
-            self.images_folder_edit.text(),
+            images_folder,
             telemetry_file,
-            self.output_folder_edit.text(),
+            output_folder,
             self.settings,
-            self.get_project_path(),
-            self.project_name_edit.text().strip()
+            build_project_path(output_folder, project_name),
+            project_name
         )
 
         self.processor_thread.progress_updated.connect(self.update_progress)
@@ -562,13 +878,25 @@ class OrthophotoWidget(QtWidgets.QWidget):
 
         self.processor_thread.start()
 
+    def ensure_progress_bar(self):
+        """Создание прогресс бара над строкой статуса"""
+        if self.progress_bar is None:
+            self.progress_bar = QtWidgets.QProgressBar()
+            layout = self.layout()
+            layout.insertWidget(layout.indexOf(self.status_label), self.progress_bar)
+
     def update_progress(self, value):
         """Обновление прогресс бара"""
         self.progress_bar.setValue(value)
 
     def update_status(self, message):
         """Обновление статуса"""
-        short_message = message[:15] + "..." if len(message) > 15 else message
+        if message == self._last_status:
+            return
+        self._last_status = message
+
+        short_message = self._status_metrics.elidedText(message, QtCore.Qt.ElideRight,
+                                                         self.status_label.width() or 150)
         self.status_label.setText(short_message)
         self.status_label.setToolTip(message)
 
@@ -613,33 +941,46 @@ def show_orthophoto_dialog():
         Metashape.app.messageBox(f"Ошибка создания диалога: {str(e)}")
 
 
-def add_orthophoto_menu():
-    """Добавление пункта меню для ортофотоплана"""
-    try:
-        # Получаем приложение
-        app = QtWidgets.QApplication.instance()
-        main_window = None
-
+def find_main_window():
+    """Поиск главного окна Metashape"""
+    app = QtWidgets.QApplication.instance()
+    main_window = app.activeWindow()
+    if not isinstance(main_window, QtWidgets.QMainWindow):
         # Ищем главное окно среди виджетов
-        for widget in app.topLevelWidgets():
-            if isinstance(widget, QtWidgets.QMainWindow):
-                main_window = widget
-                break
+        main_window = next((widget for widget in app.topLevelWidgets()
+                            if isinstance(widget, QtWidgets.QMainWindow)), None)
+    return main_window
 
-        if not main_window:
-            print("Main window not found!")
-            return
 
-        menubar = main_window.menuBar()
+def find_automation_menu(main_window):
+    """Поиск или создание меню «Автоматизация»"""
+    menubar = main_window.menuBar()
+    # Меню, созданное при прошлом запуске скрипта, находится по имени объекта
+    automation_menu = menubar.findChild(QtWidgets.QMenu, "automationMenu")
 
-        automation_menu = None
+    if not automation_menu:
         for action in menubar.actions():
             if action.text() == "Автоматизация":
                 automation_menu = action.menu()
                 break
 
-        if not automation_menu:
-            automation_menu = menubar.addMenu("Автоматизация")
+    if not automation_menu:
+        automation_menu = menubar.addMenu("Автоматизация")
+        automation_menu.setObjectName("automationMenu")
+
+    return automation_menu
+
+
+def add_orthophoto_menu():
+    """Добавление пункта меню для ортофотоплана"""
+    try:
+        main_window = find_main_window()
+
+        if not main_window:
+            print("Main window not found!")
+            return
+
+        automation_menu = find_automation_menu(main_window)
 
         orthophoto_action = QtWidgets.QAction("Создать ортофотоплан", main_window)
         orthophoto_action.triggered.connect(show_orthophoto_dialog)